@@ -4,9 +4,15 @@ from werkzeug.security import generate_password_hash, check_password_hash
 import jwt
 from datetime import datetime, timedelta
 from functools import wraps
-from database import users_db, redis_client
+from database import users_db, redis_client, cpu_pool
 import os
+import json
+import time
+import hashlib
+import threading
+from cachetools import TTLCache
 from bson import ObjectId
+from pymongo.errors import DuplicateKeyError
 from dotenv import load_dotenv
 
 load_dotenv()
@@ -14,6 +20,50 @@ load_dotenv()
 auth_bp = Blueprint('auth', __name__)
 
 SECRET_KEY = str(os.getenv('SECRET_KEY', 'your-fallback-secret-key-here'))
+SECRET_KEY_BYTES = SECRET_KEY.encode('utf-8')
+
+_auth_l1 = TTLCache(maxsize=10_000, ttl=30)
+_l1_lock = threading.Lock()
+
+def token_hash(token):
+    return hashlib.sha256(token.encode()).hexdigest()
+
+def load_token_user(token, th):
+    pipe = redis_client.pipeline(transaction=False)
+    pipe.get(f"blacklist_token:{token}")
+    pipe.get(f"authcache:{th}")
+    blacklisted, cached = pipe.execute()
+
+    if blacklisted:
+        return None, True, 0
+
+    if cached:
+        user = json.loads(cached)
+        return user, False, user.pop('exp')
+
+    payload = jwt.decode(token, SECRET_KEY_BYTES, algorithms=["HS256"])
+    user = users_db.users.find_one(
+        {'_id': ObjectId(payload['user_id'])},
+        projection={'_id': 1, 'email': 1, 'username': 1}
+    )
+
+    if not user:
+        return None, False, 0
+
+    current_user = {
+        '_id': str(user['_id']),
+        'username': user['username'],
+        'email': user['email']
+    }
+    exp = payload['exp']
+
+    redis_client.setex(
+        f"authcache:{th}",
+        max(1, exp - int(time.time())),
+        json.dumps({**current_user, 'exp': exp})
+    )
+
+    return current_user, False, exp
 
 def token_required(f):
     @wraps(f)
@@ -35,15 +85,23 @@ def token_required(f):
             if not token:
                 return jsonify({'error': 'Token is missing'}), 401
 
-            if redis_client.get(f"blacklist_token:{token}"):
-                return jsonify({'error': 'Token has been revoked'}), 401
+            th = token_hash(token)
+            with _l1_lock:
+                l1_entry = _auth_l1.get(th)
 
-            payload = jwt.decode(token, SECRET_KEY, algorithms=["HS256"])
-            current_user = users_db.users.find_one({'_id': ObjectId(payload['user_id'])})
-            
-            if not current_user:
+            if not l1_entry or (not l1_entry[1] and l1_entry[2] <= time.time()):
+                l1_entry = load_token_user(token, th)
+                with _l1_lock:
+                    _auth_l1[th] = l1_entry
+
+            user, revoked, _ = l1_entry
+            if revoked:
+                return jsonify({'error': 'Token has been revoked'}), 401
+            if not user:
                 return jsonify({'error': 'User not found'}), 401
 
+            current_user = dict(user)
+
         except jwt.ExpiredSignatureError:
             return jsonify({'error': 'Token has expired'}), 401
         except jwt.InvalidTokenError:
@@ -67,13 +125,13 @@ def register():
         if not all(field in data for field in required_fields):
             return jsonify({'error': f'Missing required fields: {", ".join(required_fields)}'}), 400
 
-        if users_db.users.find_one({'email': data['email'].lower()}):
+        if users_db.users.find_one({'email': data['email'].lower().strip()}):
             return jsonify({'error': 'Email already registered'}), 400
 
         user = {
             'username': data['username'].strip(),
             'email': data['email'].lower().strip(),
-            'password': generate_password_hash(data['password']),
+            'password': cpu_pool.submit(generate_password_hash, data['password']).result(),
             'created_at': datetime.utcnow(),
             'updated_at': datetime.utcnow(),
             'last_login': None
@@ -86,6 +144,8 @@ def register():
             'user_id': str(result.inserted_id)
         }), 201
 
+    except DuplicateKeyError:
+        return jsonify({'error': 'Email already registered'}), 400
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
@@ -100,9 +160,12 @@ def login():
         if not data or not data.get('email') or not data.get('password'):
             return jsonify({'error': 'Missing email or password'}), 400
 
-        user = users_db.users.find_one({'email': data['email'].lower().strip()})
+        user = users_db.users.find_one(
+            {'email': data['email'].lower().strip()},
+            projection={'_id': 1, 'email': 1, 'username': 1, 'password': 1}
+        )
 
-        if not user or not check_password_hash(user['password'], data['password']):
+        if not user or not cpu_pool.submit(check_password_hash, user['password'], data['password']).result():
             return jsonify({'error': 'Invalid credentials'}), 401
 
         token_payload = {
@@ -111,7 +174,7 @@ def login():
             'exp': datetime.utcnow() + timedelta(hours=24)
         }
 
-        token = jwt.encode(token_payload, SECRET_KEY, algorithm="HS256")
+        token = jwt.encode(token_payload, SECRET_KEY_BYTES, algorithm="HS256")
 
         users_db.users.update_one(
             {'_id': user['_id']},
@@ -142,15 +205,21 @@ def logout(current_user):
         auth_header = request.headers.get('Authorization')
         token = auth_header.split(' ')[1] if ' ' in auth_header else auth_header
 
-        redis_client.setex(
+        th = token_hash(token)
+        pipe = redis_client.pipeline(transaction=False)
+        pipe.setex(
             f"blacklist_token:{token}",
             timedelta(hours=24),
             'blacklisted'
         )
+        pipe.delete(f"authcache:{th}")
+        pipe.execute()
+        with _l1_lock:
+            _auth_l1.pop(th, None)
 
         return jsonify({
             'message': 'Successfully logged out',
-            'user_id': str(current_user['_id'])
+            'user_id': current_user['_id']
         })
 
     except Exception as e:
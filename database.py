@@ -4,9 +4,21 @@ import redis
 from opensearchpy import OpenSearch, helpers
 from langchain_community.vectorstores import OpenSearchVectorSearch
 from langchain_community.embeddings import HuggingFaceEmbeddings
+from langchain_core.embeddings import Embeddings
+from transformers import AutoTokenizer
+import onnxruntime as ort
+import numpy as np
 import os
 from dotenv import load_dotenv
 import logging
+try:
+    from gevent import monkey
+    if not monkey.is_module_patched('threading'):
+        raise ImportError
+    # Native threads that greenlets can wait on without blocking the hub
+    from gevent.threadpool import ThreadPoolExecutor
+except ImportError:
+    from concurrent.futures import ThreadPoolExecutor
 
 logging.basicConfig(
     level=logging.INFO,
@@ -16,16 +28,35 @@ logger = logging.getLogger(__name__)
 
 load_dotenv()
 
+# CPU-bound work (password hashing, embedding) runs here so it stays off
+# the gevent hub; PDFium is not thread-safe, so PDF parsing gets one thread
+cpu_pool = ThreadPoolExecutor(max_workers=os.cpu_count() or 1)
+pdf_pool = ThreadPoolExecutor(max_workers=1)
+
 mongo_client = MongoClient('')
 products_db = mongo_client.products
 blogs_db = mongo_client.blogs
 users_db = mongo_client.users
 
+def ensure_mongo_indexes():
+    """Create MongoDB indexes used by auth, blog and product lookups"""
+    try:
+        users_db.users.create_index('email', unique=True, background=True)
+        blogs_db.blogs.create_index([('author_id', 1), ('created_at', -1)], background=True)
+        products_db.products.create_index([('category', 1)], background=True)
+        products_db.products.create_index([('tags', 1)], background=True)
+    except Exception as e:
+        logger.error(f"Error creating MongoDB indexes: {str(e)}")
+
+ensure_mongo_indexes()
+
 redis_client = redis.Redis(
     host=os.getenv('REDIS_HOST', 'localhost'),
     port=int(os.getenv('REDIS_PORT', 6379)),
     db=0,
-    decode_responses=True
+    decode_responses=True,
+    socket_keepalive=True,
+    health_check_interval=30
 )
 
 OPENSEARCH_INDEX = "documents"
@@ -74,18 +105,77 @@ opensearch_client = OpenSearch(
     retry_on_timeout=True
 )
 
-embeddings = HuggingFaceEmbeddings(
-    model_name="sentence-transformers/all-mpnet-base-v2",
-    model_kwargs={
-        'device': 'cuda',
-        'trust_remote_code': True
-    },
-    encode_kwargs={
-        'normalize_embeddings': True,
-        'batch_size': 8
-    }
+EMBEDDING_MODEL_NAME = "sentence-transformers/all-mpnet-base-v2"
+ONNX_EMBEDDING_PATH = os.getenv('ONNX_EMBEDDING_PATH', 'onnx_mpnet')
+ONNX_EMBEDDING_FILES = ("model_quantized.onnx", "model.onnx")
+ONNX_QUANTIZED_PROVIDERS = ['CPUExecutionProvider']
+ONNX_PROVIDERS = ['CUDAExecutionProvider', 'CPUExecutionProvider']
+
+class OnnxEmbeddings(Embeddings):
+    """Sentence-transformers embeddings served from an int8 ONNX Runtime export"""
+
+    def __init__(self, model_path, batch_size=32, normalize_embeddings=True):
+        self.tokenizer = AutoTokenizer.from_pretrained(os.path.dirname(model_path))
+        # Dynamic int8 ops mostly fall back to CPU under the CUDA provider,
+        # so the quantized export runs on CPU only
+        self.session = ort.InferenceSession(
+            model_path,
+            providers=ONNX_QUANTIZED_PROVIDERS if model_path.endswith("_quantized.onnx") else ONNX_PROVIDERS
+        )
+        self.input_names = {i.name for i in self.session.get_inputs()}
+        self.batch_size = batch_size
+        self.normalize_embeddings = normalize_embeddings
+
+    def _embed_batch(self, texts):
+        encoded = self.tokenizer(
+            texts,
+            padding=True,
+            truncation=True,
+            max_length=384,
+            return_tensors="np"
+        )
+        inputs = {k: v.astype(np.int64) for k, v in encoded.items() if k in self.input_names}
+        token_embeddings = self.session.run(None, inputs)[0]
+
+        mask = encoded['attention_mask'][..., None].astype(np.float32)
+        pooled = (token_embeddings * mask).sum(axis=1) / np.clip(mask.sum(axis=1), 1e-9, None)
+
+        if self.normalize_embeddings:
+            pooled /= np.clip(np.linalg.norm(pooled, axis=1, keepdims=True), 1e-12, None)
+
+        return pooled.tolist()
+
+    def embed_documents(self, texts):
+        results = []
+        for i in range(0, len(texts), self.batch_size):
+            results.extend(self._embed_batch(texts[i:i + self.batch_size]))
+        return results
+
+    def embed_query(self, text):
+        return self._embed_batch([text])[0]
+
+onnx_model_path = next(
+    (os.path.join(ONNX_EMBEDDING_PATH, name) for name in ONNX_EMBEDDING_FILES
+     if os.path.exists(os.path.join(ONNX_EMBEDDING_PATH, name))),
+    None
 )
 
+if onnx_model_path:
+    embeddings = OnnxEmbeddings(onnx_model_path, batch_size=32)
+else:
+    logger.warning(f"ONNX embedding model not found at {ONNX_EMBEDDING_PATH}, falling back to HuggingFaceEmbeddings")
+    embeddings = HuggingFaceEmbeddings(
+        model_name=EMBEDDING_MODEL_NAME,
+        model_kwargs={
+            'device': 'cuda',
+            'trust_remote_code': True
+        },
+        encode_kwargs={
+            'normalize_embeddings': True,
+            'batch_size': 8
+        }
+    )
+
 def ensure_opensearch_index():
     """Create OpenSearch index if it doesn't exist"""
     try:
@@ -102,14 +192,16 @@ def ensure_opensearch_index():
         logger.error(f"Error creating OpenSearch index: {str(e)}")
         raise
 
-def bulk_index_documents(documents, metadata_list):
-    """Bulk index documents with their embeddings"""
-    try:
-        embeddings_list = embeddings.embed_documents(documents)
-        
-        actions = []
-        for doc, embed, meta in zip(documents, embeddings_list, metadata_list):
-            action = {
+EMBEDDING_BATCH_SIZE = 32
+
+def generate_index_actions(documents, metadata_list):
+    """Embed documents in batches and yield OpenSearch index actions"""
+    for i in range(0, len(documents), EMBEDDING_BATCH_SIZE):
+        docs = documents[i:i + EMBEDDING_BATCH_SIZE]
+        metas = metadata_list[i:i + EMBEDDING_BATCH_SIZE]
+        embeds = cpu_pool.submit(embeddings.embed_documents, docs).result()
+        for doc, embed, meta in zip(docs, embeds, metas):
+            yield {
                 "_index": OPENSEARCH_INDEX,
                 "_source": {
                     "content": doc,
@@ -117,24 +209,35 @@ def bulk_index_documents(documents, metadata_list):
                     "metadata": meta
                 }
             }
-            actions.append(action)
-        
-        if actions:
-            success, errors = helpers.bulk(
-                opensearch_client, 
-                actions, 
-                raise_on_error=False,
-                raise_on_exception=False
-            )
-            
-            if errors:
-                logger.warning(f"Some documents failed to index: {errors}")
-            
-            logger.info(f"Successfully indexed {success} documents")
-            return success
-            
-        return 0
-        
+
+def bulk_index_documents(documents, metadata_list, refresh=False):
+    """Bulk index documents with their embeddings"""
+    try:
+        if not documents:
+            return 0
+
+        success = 0
+        errors = []
+        for ok, item in helpers.parallel_bulk(
+            opensearch_client,
+            generate_index_actions(documents, metadata_list),
+            thread_count=4,
+            chunk_size=100,
+            raise_on_error=False,
+            raise_on_exception=False,
+            refresh=refresh
+        ):
+            if ok:
+                success += 1
+            else:
+                errors.append(item)
+
+        if errors:
+            logger.warning(f"Some documents failed to index: {errors}")
+
+        logger.info(f"Successfully indexed {success} documents")
+        return success
+
     except Exception as e:
         logger.error(f"Error in bulk indexing: {str(e)}")
         raise
@@ -0,0 +1,13 @@
+# gunicorn.conf.py
+import os
+
+bind = f"0.0.0.0:{os.getenv('PORT', 5000)}"
+workers = int(os.getenv('GUNICORN_WORKERS', 4))
+worker_class = 'gevent'
+worker_connections = 1000
+timeout = 300
+
+# Import the app in each worker after fork so every worker initializes
+# its own CUDA context for the embedding model; text generation is served
+# by the shared vLLM server (see setup.md)
+preload_app = False
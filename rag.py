@@ -1,12 +1,14 @@
 from flask import Blueprint, request, jsonify, current_app
 from auth import token_required
-import torch
-from transformers import AutoTokenizer, AutoModelForCausalLM, pipeline
-from database import vector_store, blogs_db, products_db, bulk_index_documents, search_documents, opensearch_client
+import numpy as np
+from database import vector_store, blogs_db, products_db, bulk_index_documents, search_documents, opensearch_client, redis_client, pdf_pool
 import os
 from datetime import datetime
-from PyPDF2 import PdfReader
-import io
+import pypdfium2 as pdfium
+import re
+import json
+import hashlib
+import xxhash
 from werkzeug.utils import secure_filename
 from bson import ObjectId
 import requests
@@ -19,55 +21,83 @@ logger = logging.getLogger(__name__)
 
 rag_bp = Blueprint('rag', __name__)
 
-MODEL_PATH = r""
+VLLM_URL = os.getenv('VLLM_URL', 'http://localhost:8000')
+
+CONTEXT_CACHE_TTL = 600
+CONTEXT_VERSION_KEY = "ctx:version"
+
+class TextGenerationPipeline:
+    """Adapter exposing a shared vLLM server through the HF text-generation pipeline call shape"""
+
+    def __init__(self, base_url: str, model: str):
+        self.url = f"{base_url.rstrip('/')}/v1/completions"
+        self.model = model
+        self.session = requests.Session()
+
+    def generate(self, prompt: str, max_new_tokens: int, temperature: float = 0.6, top_p: float = 0.85,
+                 repetition_penalty: float = 1.2, num_return_sequences: int = 1, do_sample: bool = True, **kwargs):
+        response = self.session.post(
+            self.url,
+            json={
+                "model": self.model,
+                "prompt": prompt,
+                "n": num_return_sequences,
+                "temperature": temperature if do_sample else 0.0,
+                "top_p": top_p if do_sample else 1.0,
+                "repetition_penalty": repetition_penalty,
+                "max_tokens": max_new_tokens
+            },
+            timeout=300
+        )
+        response.raise_for_status()
+        return [choice['text'] for choice in response.json()['choices']]
+
+    def __call__(self, prompt: str, max_new_tokens: int = 256, **kwargs):
+        return [
+            {'generated_text': prompt + text}
+            for text in self.generate(prompt, max_new_tokens, **kwargs)
+        ]
 
 def initialize_model():
     try:
-        tokenizer = AutoTokenizer.from_pretrained(
-            MODEL_PATH,
-            trust_remote_code=True,
-            padding_side='left'
-        )
-        tokenizer.pad_token = tokenizer.eos_token
-
-        model = AutoModelForCausalLM.from_pretrained(
-            MODEL_PATH,
-            device_map="auto",
-            torch_dtype=torch.float16,
-            trust_remote_code=True,
-            load_in_8bit=True
-        )
-
-        pipe = pipeline(
-            "text-generation",
-            model=model,
-            tokenizer=tokenizer,
-            max_length=2048,
-            temperature=0.6,
-            top_p=0.85,
-            repetition_penalty=1.2,
-            device_map="auto",
-            pad_token_id=tokenizer.pad_token_id,
-            no_repeat_ngram_size=3
-        )
+        response = requests.get(f"{VLLM_URL.rstrip('/')}/v1/models", timeout=10)
+        response.raise_for_status()
+        model_name = response.json()['data'][0]['id']
 
-        return model, tokenizer, pipe
+        return TextGenerationPipeline(VLLM_URL, model_name)
 
     except Exception as e:
         logger.error(f"Model initialization error: {str(e)}")
         raise
 
-model, tokenizer, generator = initialize_model()
+generator = initialize_model()
+
+def pdf_source(file):
+    stream = file.stream
+    stream.seek(0)
+    if hasattr(stream, 'readinto'):
+        return stream
+    # SpooledTemporaryFile only gained readinto in Python 3.11; its
+    # underlying BytesIO/TemporaryFile already has it
+    inner = getattr(stream, '_file', None)
+    if inner is not None and hasattr(inner, 'readinto'):
+        return inner
+    return stream.read()
 
 def process_pdf(file):
     try:
-        pdf_stream = io.BytesIO(file.read())
-        pdf_reader = PdfReader(pdf_stream)
+        pdf = pdfium.PdfDocument(pdf_source(file))
         text = []
-        for page in pdf_reader.pages:
-            content = page.extract_text()
-            if content:
-                text.append(content)
+        try:
+            for page in pdf:
+                textpage = page.get_textpage()
+                content = textpage.get_text_range()
+                textpage.close()
+                page.close()
+                if content:
+                    text.append(content)
+        finally:
+            pdf.close()
         return "\n".join(text).strip()
     except Exception as e:
         logger.error(f"PDF processing error: {str(e)}")
@@ -75,77 +105,122 @@ def process_pdf(file):
 
 def chunk_text(text: str, chunk_size: int = 1000):
     words = text.split()
+    if not words:
+        return []
+
+    word_sizes = np.fromiter(map(len, words), dtype=np.int64, count=len(words)) + 1
+    offsets = np.concatenate(([0], np.cumsum(word_sizes)))
+
     chunks = []
-    current_chunk = []
-    current_size = 0
-
-    for word in words:
-        word_size = len(word) + 1
-        if current_size + word_size > chunk_size:
-            chunks.append(" ".join(current_chunk))
-            current_chunk = [word]
-            current_size = word_size
-        else:
-            current_chunk.append(word)
-            current_size += word_size
-
-    if current_chunk:
-        chunks.append(" ".join(current_chunk))
+    start = 0
+    while start < len(words):
+        end = int(np.searchsorted(offsets, offsets[start] + chunk_size, side='right')) - 1
+        end = max(end, start + 1)
+        chunks.append(" ".join(words[start:end]))
+        start = end
 
     return chunks
 
-def extract_search_terms(topic: str):
-    common_words = {'and', 'or', 'the', 'a', 'an', 'in', 'on', 'at', 'to', 'for', 'of', 'with', 'by', 'about', 'explain', 'me'}
-    terms = topic.lower().split()
-    return [term for term in terms if term not in common_words]
+SEARCH_TOKEN_RE = re.compile(r"\w+")
+SEARCH_STOP_WORDS = frozenset({'and', 'or', 'the', 'a', 'an', 'in', 'on', 'at', 'to', 'for', 'of', 'with', 'by', 'about', 'explain', 'me'})
 
-def get_relevant_context(topic: str, limit: int = 5):
-    try:
-        search_query = {
-            "query": {
-                "bool": {
-                    "should": [
-                        {
-                            "multi_match": {
+def extract_search_terms(topic: str):
+    return [term for term in SEARCH_TOKEN_RE.findall(topic.lower()) if term not in SEARCH_STOP_WORDS]
+
+def build_context_query(topic: str, limit: int = 5):
+    return {
+        "query": {
+            "bool": {
+                "should": [
+                    {
+                        "multi_match": {
+                            "query": topic,
+                            "fields": ["content^3", "metadata.filename"],
+                            "type": "best_fields",
+                            "fuzziness": "AUTO",
+                            "minimum_should_match": "30%"
+                        }
+                    },
+                    {
+                        "match": {
+                            "content": {
                                 "query": topic,
-                                "fields": ["content^3", "metadata.filename"],
-                                "type": "best_fields",
-                                "fuzziness": "AUTO",
-                                "minimum_should_match": "30%"
-                            }
-                        },
-                        {
-                            "match": {
-                                "content": {
-                                    "query": topic,
-                                    "operator": "or",
-                                    "minimum_should_match": "2<70%"
-                                }
+                                "operator": "or",
+                                "minimum_should_match": "2<70%"
                             }
                         }
-                    ],
-                    "minimum_should_match": 1
-                }
-            },
-            "min_score": 0.1,
-            "size": limit
-        }
-
-        results = opensearch_client.search(
-            index="documents",
-            body=search_query
-        )
-
-        context = []
-        for hit in results['hits']['hits']:
-            if 'content' in hit['_source']:
-                context.append(hit['_source']['content'])
+                    }
+                ],
+                "minimum_should_match": 1
+            }
+        },
+        "min_score": 0.1,
+        "size": limit
+    }
+
+def extract_hit_contents(hits):
+    return [hit['_source']['content'] for hit in hits if 'content' in hit['_source']]
+
+def context_cache_key(topic: str, limit: int):
+    digest = hashlib.sha1(topic.lower().strip().encode()).hexdigest()
+    return f"ctx:{limit}:{digest}"
+
+def load_cached_context(cached, version):
+    if not cached:
+        return None
+    entry = json.loads(cached)
+    return entry['context'] if entry['version'] == version else None
+
+def invalidate_context_cache():
+    redis_client.incr(CONTEXT_VERSION_KEY)
+
+def get_relevant_contexts(topics: List[str], limit: int = 5):
+    if not topics:
+        return []
 
-        return context
+    try:
+        keys = [context_cache_key(topic, limit) for topic in topics]
+        pipe = redis_client.pipeline(transaction=False)
+        pipe.get(CONTEXT_VERSION_KEY)
+        pipe.mget(keys)
+        version, cached_entries = pipe.execute()
+        version = version or '0'
+        contexts = [load_cached_context(cached, version) for cached in cached_entries]
+
+        misses = [i for i, context in enumerate(contexts) if context is None]
+        if misses:
+            body = []
+            for i in misses:
+                body.append({"index": "documents"})
+                body.append(build_context_query(topics[i], limit))
+
+            results = opensearch_client.msearch(body=body)
+
+            pipe = redis_client.pipeline(transaction=False)
+            for i, response in zip(misses, results['responses']):
+                if 'error' in response:
+                    logger.error(f"Error getting context: {response['error']}")
+                    contexts[i] = []
+                    continue
+                contexts[i] = extract_hit_contents(response['hits']['hits'])
+                pipe.setex(keys[i], CONTEXT_CACHE_TTL, json.dumps({'version': version, 'context': contexts[i]}))
+            pipe.execute()
+
+        return [content for context in contexts for content in context]
     except Exception as e:
         logger.error(f"Error getting context: {str(e)}")
         return []
 
+def dedupe_context(context: List[str]):
+    seen = set()
+    unique = []
+    for content in context:
+        digest = xxhash.xxh3_64_intdigest(content)
+        if digest not in seen:
+            seen.add(digest)
+            unique.append(content)
+    return unique
+
 def generate_blog_content(topic: str, context: List[str], target_words: int = 800):
     try:
         if not context:
@@ -226,7 +301,7 @@ def upload_document(current_user):
 
         filename = secure_filename(file.filename)
 
-        text_content = process_pdf(file)
+        text_content = pdf_pool.submit(process_pdf, file).result()
         if not text_content:
             return jsonify({'error': 'Could not extract text from PDF'}), 400
 
@@ -235,13 +310,14 @@ def upload_document(current_user):
         metadata_list = [{
             "filename": filename,
             "chunk_id": i,
-            "user_id": str(current_user['_id']),
+            "user_id": current_user['_id'],
             "upload_date": datetime.utcnow().isoformat(),
             "total_chunks": len(chunks),
             "content_type": "pdf"
         } for i in range(len(chunks))]
 
-        indexed_count = bulk_index_documents(chunks, metadata_list)
+        indexed_count = bulk_index_documents(chunks, metadata_list, refresh='wait_for')
+        invalidate_context_cache()
 
         return jsonify({
             'message': 'Document processed successfully',
@@ -265,12 +341,9 @@ def create_blog(current_user):
         topic = data['topic']
         search_terms = extract_search_terms(topic)
         
-        all_context = []
-        for term in search_terms:
-            context = get_relevant_context(term)
-            all_context.extend(context)
+        all_context = get_relevant_contexts(search_terms)
         
-        all_context = list(dict.fromkeys(all_context))
+        all_context = dedupe_context(all_context)
         
         if not all_context:
             return jsonify({
@@ -291,7 +364,7 @@ def create_blog(current_user):
         blog = {
             'topic': topic,
             'content': blog_content,
-            'author_id': current_user['_id'],
+            'author_id': ObjectId(current_user['_id']),
             'created_at': datetime.utcnow(),
             'word_count': len(blog_content.split()),
             'source_documents': len(all_context)
@@ -302,7 +375,7 @@ def create_blog(current_user):
         metadata = {
             "type": "blog",
             "blog_id": str(result.inserted_id),
-            "author_id": str(current_user['_id']),
+            "author_id": current_user['_id'],
             "timestamp": datetime.utcnow().isoformat(),
             "topic": topic
         }
@@ -329,7 +402,7 @@ def get_products(current_user):
         if not blog_id:
             return jsonify({'error': 'Blog ID is required'}), 400
 
-        blog = blogs_db.blogs.find_one({'_id': ObjectId(blog_id)})
+        blog = blogs_db.blogs.find_one({'_id': ObjectId(blog_id)}, {'topic': 1, 'content': 1})
         if not blog:
             return jsonify({'error': 'Blog not found'}), 404
 
@@ -389,7 +462,7 @@ def search_content(current_user):
             query,
             filters=[{
                 "term": {
-                    "metadata.user_id": str(current_user['_id'])
+                    "metadata.user_id": current_user['_id']
                 }
             }]
         )
@@ -401,12 +474,4 @@ def search_content(current_user):
 
     except Exception as e:
         logger.error(f"Search error: {str(e)}")
-        return jsonify({'error': str(e)}), 500
-
-def cleanup_gpu_memory():
-    if torch.cuda.is_available():
-        torch.cuda.empty_cache()
-
-@rag_bp.before_request
-def before_request():
-    cleanup_gpu_memory()
\ No newline at end of file
+        return jsonify({'error': str(e)}), 500
\ No newline at end of file
@@ -0,0 +1,9 @@
+# wsgi.py
+from gevent import monkey
+monkey.patch_all()
+
+import torch.multiprocessing
+
+torch.multiprocessing.set_start_method('spawn', force=True)
+
+from app import app